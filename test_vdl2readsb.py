@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+import vdl2readsb
+
+
+class WarnAggregatorTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('vdl2readsb.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def messages(self, logs):
+        return [r.getMessage() for r in logs.records]
+
+    def test_suppress_within_window(self):
+        w = vdl2readsb.WarnAggregator(window=60, summary_interval=3600)
+        with self.assertLogs('vdl2readsb', 'WARNING') as logs:
+            for _ in range(5):
+                w.warn('unknown_hex', 'AE1234', 'unknown icao hex: "%s"', 'AE1234')
+                self.now += 1
+        self.assertEqual(self.messages(logs), ['unknown icao hex: "AE1234"'])
+        self.assertEqual(w.top(), [('unknown_hex', 'AE1234', 5)])
+
+    def test_repeats_suppressed_suffix(self):
+        w = vdl2readsb.WarnAggregator(window=60, summary_interval=3600)
+        with self.assertLogs('vdl2readsb', 'WARNING') as logs:
+            for _ in range(3):
+                w.warn('reg2icao', 'N1', 'not found "%s"', 'N1')
+            self.now += 60
+            w.warn('reg2icao', 'N1', 'not found "%s"', 'N1')
+        self.assertEqual(self.messages(logs), [
+            'not found "N1"',
+            'not found "N1" (2 repeats suppressed)',
+        ])
+
+    def test_summary_resets_period(self):
+        w = vdl2readsb.WarnAggregator(window=60, summary_interval=100)
+        with self.assertLogs('vdl2readsb', 'WARNING') as logs:
+            w.warn('reg2icao', 'N1', 'not found "%s"', 'N1')
+            w.warn('reg2icao', 'N1', 'not found "%s"', 'N1')
+            self.now += 100
+            w.check_summary()
+        self.assertIn('warnings in the last 100s: reg2icao: 2',
+                      self.messages(logs))
+        self.assertEqual(w.period, {})
+        self.assertEqual(w.top(period=True), [])
+        self.assertEqual(w.top(), [('reg2icao', 'N1', 2)])
+
+    def test_eviction_keeps_hot_keys(self):
+        w = vdl2readsb.WarnAggregator(window=600, summary_interval=3600, max_keys=8)
+        with self.assertLogs('vdl2readsb', 'WARNING') as logs:
+            for i in range(20):
+                w.warn('unknown_hex', 'HOT', 'hex %s', 'HOT')
+                w.warn('unknown_hex', f'{i:06X}', 'hex %s', i)
+                self.now += 1
+        self.assertEqual(self.messages(logs).count('hex HOT'), 1)
+        self.assertEqual(w.top(1), [('unknown_hex', 'HOT', 20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,15 +12,109 @@ from datetime import datetime
 import vdl2parsedefs
 
 
+class WarnAggregator:
+    """Rate-limits repeated warnings.
+
+    The first occurrence of each (category, key) is logged, repeats within
+    `window` seconds are only counted. Summaries with the counts are logged
+    by check_summary() once `summary_interval` seconds have passed; it runs on
+    every warning and should also be called from the input loop, otherwise
+    no summary is logged while no warnings arrive. At most `max_keys` keys
+    are tracked, the least recently seen ones are dropped when the table
+    is full.
+    """
+
+    def __init__(self, window=600, summary_interval=3600, max_keys=1000):
+        self.logger = logging.getLogger(__name__)
+        self.window = window
+        self.summary_interval = summary_interval
+        self.max_keys = max_keys
+        # (category, key) ->
+        #     [total count, suppressed, last logged, period count, last seen]
+        self.table = {}
+        self.period = {}
+        self.evicted = {}
+        self.last_summary = time.monotonic()
+
+    def warn(self, category, key, fmt, *args):
+        now = time.monotonic()
+        self.period[category] = self.period.get(category, 0) + 1
+        entry = self.table.get((category, key))
+        if entry is None:
+            if len(self.table) >= self.max_keys:
+                self.prune()
+            entry = self.table[(category, key)] = [0, 0, None, 0, now]
+        entry[0] += 1
+        entry[3] += 1
+        entry[4] = now
+        if entry[2] is None or now - entry[2] >= self.window:
+            if entry[1]:
+                fmt += ' (%d repeats suppressed)'
+                args += (entry[1],)
+            self.logger.warning(fmt, *args)
+            entry[1] = 0
+            entry[2] = now
+        else:
+            entry[1] += 1
+        self.check_summary(now)
+
+    def prune(self):
+        # drop the least recently seen quarter so that eviction cost is
+        # amortized, keys that are still being hit keep their state
+        entries = sorted(self.table.items(), key=lambda kv: kv[1][4])
+        for (c, k), e in entries[:max(1, len(entries)//4)]:
+            if e[1]:
+                self.evicted[c] = self.evicted.get(c, 0) + e[1]
+            del self.table[(c, k)]
+
+    def top(self, n=10, category=None, period=False):
+        """Returns [(category, key, count), ...] sorted by count.
+
+        Counts are cumulative unless `period` is set, then only the
+        warnings since the last summary are counted.
+        """
+        i = 3 if period else 0
+        entries = [(c, k, e[i]) for (c, k), e in self.table.items()
+                   if e[i] and (category is None or c == category)]
+        entries.sort(key=lambda x: x[2], reverse=True)
+        return entries[:n]
+
+    def check_summary(self, now=None):
+        now = now or time.monotonic()
+        if now - self.last_summary >= self.summary_interval:
+            self.summary(now)
+
+    def summary(self, now=None):
+        now = now or time.monotonic()
+        elapsed = now - self.last_summary
+        self.last_summary = now
+        if self.period:
+            self.logger.warning('warnings in the last %ds: %s', elapsed,
+                                ', '.join(f'{c}: {n}' for c, n in sorted(self.period.items())))
+            self.logger.warning('top offenders in the last %ds: %s', elapsed,
+                                ', '.join(f'{c} "{k}": {n}' for c, k, n in self.top(period=True)))
+        if self.evicted:
+            self.logger.warning('suppressed warnings of evicted keys: %s',
+                                ', '.join(f'{c}: {n}' for c, n in sorted(self.evicted.items())))
+        self.period = {}
+        self.evicted = {}
+        for e in self.table.values():
+            e[3] = 0
+
+
+default_warnagg = WarnAggregator()
+
+
 class VDL2MsgParser:
     parsedefs = vdl2parsedefs.parsedefs
     re_parse_pos = re.compile(r'(-?)([01]?\d{2})(\d{2})\.?(\d)$')
 
-    def __init__(self, input, flight_as_callsign=True, parse_location='all', db=None):
+    def __init__(self, input, flight_as_callsign=True, parse_location='all', db=None, warnagg=None):
         self.logger = logging.getLogger(__name__)
         self.flight_as_callsign = flight_as_callsign
         self.parse_location = parse_location
         self.db = db
+        self.warnagg = warnagg or default_warnagg
         self.reset()
         self.decode(input)
 
@@ -72,7 +166,8 @@ class VDL2MsgParser:
             else:
                 result = float(spos)/div
         except Exception as e:
-            logger.warning('Error parsing coordinates "%s": ', spos, e)
+            self.warnagg.warn('pos', f'{format}: {spos}',
+                              'Error parsing coordinates "%s": %s', spos, e)
         return result
 
     def fixAddrReg(self):
@@ -87,7 +182,8 @@ class VDL2MsgParser:
         if self.db and self.reg:
             dbaddr = self.db.reg2icao(self.reg)
             if not dbaddr:
-                self.logger.warning('reg2icao: not found "%s"', self.reg)
+                self.warnagg.warn('reg2icao', self.reg,
+                                  'reg2icao: not found "%s"', self.reg)
             else:
                 self.logger.debug('reg2icao: %s -> %s', self.reg, self.addr)
 
@@ -98,11 +194,11 @@ class VDL2MsgParser:
         if self.db and self.addr:
             dbreg = self.db.icao2reg(self.addr)
             if not dbreg:
-                self.logger.warning(
-                    'unknown icao hex: "%s", reg: "%s"', self.addr, self.reg)
+                self.warnagg.warn('unknown_hex', self.addr,
+                                  'unknown icao hex: "%s", reg: "%s"', self.addr, self.reg)
             elif self.reg and self.reg != dbreg and self.reg.replace('-', '') != dbreg.replace('-', ''):
-                self.logger.warning(
-                    'reg mismatch: hex: "%s", db-reg: "%s", msg-reg: "%s"', self.addr, dbreg, self.reg)
+                self.warnagg.warn('reg_mismatch', self.addr,
+                                  'reg mismatch: hex: "%s", db-reg: "%s", msg-reg: "%s"', self.addr, dbreg, self.reg)
             self.reg = dbreg or self.reg
 
     def decode(self, input, type=None):
@@ -132,8 +228,8 @@ class VDL2MsgParser:
             self.valid = True
             return True
         except Exception as e:
-            self.logger.warning('Error decoding message: "%s"', input)
-            self.logger.warning('%s', e)
+            self.warnagg.warn('decode', f'{e.__class__.__name__}: {e}',
+                              'Error decoding message: "%s": %s', input, e)
             self.valid = False
             return False
 
@@ -353,7 +449,15 @@ if __name__ == '__main__':
                            help='TCP output connection address')
     argparser.add_argument('--zmq-port', dest='zmq_port', required=False, default=5556, type=int,
                            help='ZMQ port number to listen to (if --input=zmq)')
+    argparser.add_argument('--warn-window', dest='warn_window', required=False, default=600, type=int,
+                           help='suppress repeated warnings for the same key for this many seconds')
+    argparser.add_argument('--warn-summary', dest='warn_summary', required=False, default=3600, type=int,
+                           help='log warning summary counts every this many seconds')
     args = argparser.parse_args()
+    if args.warn_window < 0:
+        argparser.error('--warn-window must not be negative')
+    if args.warn_summary <= 0:
+        argparser.error('--warn-summary must be positive')
 
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
@@ -368,6 +472,8 @@ if __name__ == '__main__':
 
     db = AircraftDB(args.db)
 
+    warnagg = WarnAggregator(args.warn_window, args.warn_summary)
+
     if args.input == 'airframesio':
         import socketio
         while True:
@@ -378,8 +484,9 @@ if __name__ == '__main__':
                 def catch_all(event):
                     for m in event:
                         msg = VDL2MsgParser(
-                            m, args.callsign, args.location, db=db)
+                            m, args.callsign, args.location, db=db, warnagg=warnagg)
                         mprinter.printMsg(msg)
+                        warnagg.check_summary()
                 if not sio.connected:
                     sio.connect('https://api.airframes.io')
                 sio.wait()
@@ -397,9 +504,14 @@ if __name__ == '__main__':
         s.setsockopt_string(zmq.SUBSCRIBE, '')
         while True:
             data = s.recv_json()
-            msg = VDL2MsgParser(data, args.callsign, args.location, db=db)
+            msg = VDL2MsgParser(data, args.callsign, args.location,
+                                db=db, warnagg=warnagg)
             mprinter.printMsg(msg)
+            warnagg.check_summary()
     else:
         for line in sys.stdin:
-            msg = VDL2MsgParser(line, args.callsign, args.location, db=db)
+            msg = VDL2MsgParser(line, args.callsign, args.location,
+                                db=db, warnagg=warnagg)
             mprinter.printMsg(msg)
+            warnagg.check_summary()
+        warnagg.summary()